@@ -8,10 +8,16 @@ of cores you want to provide to the parallel processing routines.
 
 import itertools
 import logging
+import math
+import os
 import string
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 import dask
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
 from dask import delayed
 from nbtools import execute_in_parallel
 from planetarypy.pds.apps import get_index
@@ -53,10 +59,7 @@ def add_marking_ids(path, fan_id, blotch_id):
         except FileNotFoundError:
             continue
         else:
-            marking_ids = []
-            for _ in range(df.shape[0]):
-                marking_ids.append(next(id_))
-            df["marking_id"] = marking_ids
+            df["marking_id"] = list(itertools.islice(id_, len(df)))
             df.to_csv(fname, index=False)
 
 
@@ -66,6 +69,17 @@ def get_L1A_paths(obsid, savefolder):
     return paths
 
 
+def add_marking_ids_for_obsid(obsid, savedir, fan_id, blotch_id):
+    """Add marking_ids to all L1A clustering results of `obsid`.
+
+    Returns `obsid` so that it can be chained between `cluster_obsid` and `fnotch_obsid`
+    in a dask graph.
+    """
+    for path in get_L1A_paths(obsid, savedir):
+        add_marking_ids(path, fan_id, blotch_id)
+    return obsid
+
+
 def cluster_obsid(obsid=None, savedir=None, imgid=None, dbname=None):
     """Cluster all image_ids for given obsid (=image_name).
 
@@ -95,11 +109,33 @@ def cluster_obsid(obsid=None, savedir=None, imgid=None, dbname=None):
     return obsid
 
 
-def cluster_obsid_parallel(obsids, savedir, dbname):
+def split_into_batches(items, n_batches=None):
+    """Split `items` into at most `n_batches` consecutive lists of similar length.
+
+    Parameters
+    ----------
+    items : iterable
+        Items to distribute.
+    n_batches : int, optional
+        Number of batches. Default: 4 times the number of CPUs.
+    """
+    items = list(items)
+    if n_batches is None:
+        n_batches = 4 * (os.cpu_count() or 1)
+    size = max(1, math.ceil(len(items) / n_batches))
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+def _cluster_batch(obsids, savedir, dbname):
+    return [cluster_obsid(obsid, savedir, dbname=dbname) for obsid in obsids]
+
+
+def cluster_obsid_parallel(obsids, savedir, dbname, n_batches=None):
+    # one task per batch of obsids keeps the graph small for thousands of obsids
     lazys = []
-    for obsid in obsids:
-        lazys.append(delayed(cluster_obsid)(obsid, savedir, dbname=dbname))
-    return dask.compute(*lazys)
+    for batch in split_into_batches(obsids, n_batches):
+        lazys.append(delayed(_cluster_batch)(batch, savedir, dbname))
+    return tuple(itertools.chain.from_iterable(dask.compute(*lazys)))
 
 
 def fnotch_obsid(obsid=None, savedir=None, fnotch_via_obsid=False, imgid=None):
@@ -122,11 +158,59 @@ def fnotch_obsid(obsid=None, savedir=None, fnotch_via_obsid=False, imgid=None):
     return obsid
 
 
-def fnotch_obsid_parallel(obsids, savedir):
+def _fnotch_batch(obsids, savedir):
+    return [fnotch_obsid(obsid, savedir) for obsid in obsids]
+
+
+def fnotch_obsid_parallel(obsids, savedir, n_batches=None):
     lazys = []
-    for obsid in obsids:
-        lazys.append(delayed(fnotch_obsid)(obsid, savedir))
-    return dask.compute(*lazys)
+    for batch in split_into_batches(obsids, n_batches):
+        lazys.append(delayed(_fnotch_batch)(batch, savedir))
+    return tuple(itertools.chain.from_iterable(dask.compute(*lazys)))
+
+
+def _add_marking_ids_for_batch(obsids, savedir, fan_id, blotch_id, previous=None):
+    "`previous` is the task of the previous batch, only taken for the task order."
+    return [
+        add_marking_ids_for_obsid(obsid, savedir, fan_id, blotch_id)
+        for obsid in obsids
+    ]
+
+
+def cluster_and_fnotch_obsid_parallel(obsids, savedir, dbname, n_batches=None):
+    """Cluster, add marking_ids and fnotch `obsids` within one dask graph.
+
+    The obsids are processed in consecutive batches, one task per batch and step, which
+    keeps the graph small for thousands of obsids.
+    Each batch is fnotched as soon as its own clustering is done, instead of waiting
+    for all obsids to finish clustering.
+    The marking_id tasks are chained in the order of `obsids`, so every obsid receives
+    the same ids as in a sequential run, independent of which clustering finishes
+    first. The marking_id generators are shared between the tasks, therefore this runs
+    on the threaded scheduler.
+    """
+    fan_id = fan_id_generator()
+    blotch_id = blotch_id_generator()
+    lazys = []
+    with_ids = None
+    for batch in split_into_batches(obsids, n_batches):
+        clustered = delayed(_cluster_batch)(batch, savedir, dbname)
+        with_ids = delayed(_add_marking_ids_for_batch)(
+            clustered, savedir, fan_id, blotch_id, previous=with_ids
+        )
+        lazys.append(delayed(_fnotch_batch)(with_ids, savedir))
+    results = dask.compute(*lazys, scheduler="threads")
+    return tuple(itertools.chain.from_iterable(results))
+
+
+def calc_obsid_marking_coordinates(obsid, data, savefolder, overwrite=False):
+    """Calculate the ground coordinates for the markings `data` of `obsid`.
+
+    Module level, so that it can be sent to worker processes.
+    """
+    xy = XY2LATLON(data, savefolder, overwrite=overwrite, obsid=obsid)
+    xy.process_inpath()
+    return obsid
 
 
 class ReleaseManager:
@@ -143,6 +227,14 @@ class ReleaseManager:
         Default: False
     """
 
+    # string keys used for grouping, merging and filtering are read as categoricals
+    CATEGORICAL_DTYPES = {
+        "obsid": "category",
+        "image_name": "category",
+        "image_id": "category",
+        "tile_id": "category",
+    }
+
     DROP_FOR_TILE_COORDS = [
         "xy_hirise",
         "SampleResolution",
@@ -209,6 +301,8 @@ class ReleaseManager:
         self.overwrite = overwrite
         self._obsids = obsids
         self.dbname = dbname
+        self._fans = None
+        self._blotches = None
 
     @property
     def savefolder(self):
@@ -261,6 +355,22 @@ class ReleaseManager:
         except StopIteration:
             print(f"No file found. Looking at {self.savefolder}.")
 
+    @property
+    def fans(self):
+        "pd.DataFrame : Content of `fan_file`, parsed only once."
+        if self._fans is None:
+            self._fans = pd.read_csv(self.fan_file, dtype=self.CATEGORICAL_DTYPES)
+        return self._fans
+
+    @property
+    def blotches(self):
+        "pd.DataFrame : Content of `blotch_file`, parsed only once."
+        if self._blotches is None:
+            self._blotches = pd.read_csv(
+                self.blotch_file, dtype=self.CATEGORICAL_DTYPES
+            )
+        return self._blotches
+
     @property
     def fan_merged(self):
         return self.fan_file.parent / f"{self.fan_file.stem}_meta_merged.csv"
@@ -269,11 +379,25 @@ class ReleaseManager:
     def blotch_merged(self):
         return self.blotch_file.parent / f"{self.blotch_file.stem}_meta_merged.csv"
 
+    def _read_merged(self, csvpath):
+        "Read a merged catalog, from its Parquet copy if there is one."
+        parquetpath = csvpath.with_suffix(".parquet")
+        if not parquetpath.exists():
+            return pd.read_csv(csvpath, dtype=self.CATEGORICAL_DTYPES)
+        df = pd.read_parquet(parquetpath)
+        # same dtypes as read from the csv file
+        dtypes = {
+            col: dtype
+            for col, dtype in self.CATEGORICAL_DTYPES.items()
+            if col in df.columns
+        }
+        return df.astype(dtypes)
+
     def read_fan_file(self):
-        return pd.read_csv(self.fan_merged)
+        return self._read_merged(self.fan_merged)
 
     def read_blotch_file(self):
-        return pd.read_csv(self.blotch_merged)
+        return self._read_merged(self.blotch_merged)
 
     def check_for_todo(self, overwrite=None):
         if overwrite is None:
@@ -292,7 +416,8 @@ class ReleaseManager:
         return [(i, self.catalog, self.dbname) for i in self.todo]
 
     def get_no_of_tiles_per_obsid(self):
-        all_data = pd.read_parquet(self.dbname)
+        # only the two grouping columns are needed, skip decoding the rest
+        all_data = pd.read_parquet(self.dbname, columns=["image_name", "image_id"])
         return all_data.groupby("image_name").image_id.nunique()
 
     @property
@@ -353,8 +478,13 @@ class ReleaseManager:
         bucket = []
         for cubepath in tqdm(cubepaths):
             tc = TileCalculator(cubepath, read_data=False, dbname=self.dbname)
-            bucket.append(tc.tile_coords_df)
-        coords = pd.concat(bucket, ignore_index=True, sort=False)
+            bucket.append(pa.Table.from_pandas(tc.tile_coords_df, preserve_index=False))
+        # Arrow concatenates the column chunks without copying them. The campt output
+        # of different obsids can differ in columns and types (e.g. int vs float),
+        # permissive promotion unifies them like pd.concat did.
+        coords = pa.concat_tables(bucket, promote_options="permissive").to_pandas(
+            self_destruct=True
+        )
         coords.to_csv(self.tile_coords_path, index=False, float_format="%.7f")
         LOGGER.info("Wrote %s", str(self.tile_coords_path))
 
@@ -382,17 +512,20 @@ class ReleaseManager:
         """
         out = []
         for df in [fans, blotches]:
-            averaged = df.groupby("marking_id").mean()
-            tmp = df.drop_duplicates(subset="marking_id").set_index("marking_id")
-            averaged = averaged.join(tmp[["image_id", "obsid"]], how="inner")
-            out.append(averaged.reset_index())
+            # only vote_ratio differs between the copies of one object
+            agg = {col: "first" for col in df.columns if col != "marking_id"}
+            agg["vote_ratio"] = "mean"
+            averaged = df.groupby(
+                "marking_id", sort=False, observed=True, as_index=False
+            ).agg(agg)
+            out.append(averaged)
 
         return out
 
     def merge_all(self):
         # read in data files
-        fans = pd.read_csv(self.fan_file)
-        blotches = pd.read_csv(self.blotch_file)
+        fans = self.fans
+        blotches = self.blotches
         meta = pd.read_csv(self.metadata_path, dtype="str")
         tile_coords = pd.read_csv(self.tile_coords_path, dtype="str")
 
@@ -406,12 +539,10 @@ class ReleaseManager:
             "north_azimuth",
             "map_scale",
         ]
-        fans = fans.merge(
-            meta[cols_to_merge], left_on="obsid", right_on="OBSERVATION_ID"
-        )
-        blotches = blotches.merge(
-            meta[cols_to_merge], left_on="obsid", right_on="OBSERVATION_ID"
-        )
+        # index once, both joins reuse it
+        meta_idx = meta[cols_to_merge].set_index("OBSERVATION_ID")
+        fans = fans.join(meta_idx, on="obsid", how="inner")
+        blotches = blotches.join(meta_idx, on="obsid", how="inner")
 
         # drop unnecessary columns
         tile_coords.drop(
@@ -438,7 +569,7 @@ class ReleaseManager:
             axis=1,
             inplace=True,
         )
-        fans[self.FAN_COLUMNS_AS_PUBLISHED].to_csv(self.fan_merged, index=False)
+        write_catalog_table(fans[self.FAN_COLUMNS_AS_PUBLISHED], self.fan_merged)
         LOGGER.info("Wrote %s", str(self.fan_merged))
 
         # write out blotches catalog
@@ -452,41 +583,61 @@ class ReleaseManager:
             axis=1,
             inplace=True,
         )
-        blotches[self.BLOTCH_COLUMNS_AS_PUBLISHED].to_csv(
-            self.blotch_merged, index=False
+        write_catalog_table(
+            blotches[self.BLOTCH_COLUMNS_AS_PUBLISHED], self.blotch_merged
         )
         LOGGER.info("Wrote %s", str(self.blotch_merged))
 
     def calc_marking_coordinates(self):
-        fans = pd.read_csv(self.fan_file)
-        blotches = pd.read_csv(self.blotch_file)
-        combined = pd.concat([fans, blotches], sort=False)
-
-        for obsid in tqdm(self.obsids):
-            data = combined[combined.image_name == obsid]
-            xy = XY2LATLON(data, self.savefolder, overwrite=self.overwrite)
-            xy.process_inpath()
+        combined = pd.concat([self.fans, self.blotches], sort=False)
+        # concat of categoricals with different categories falls back to object
+        combined["image_name"] = combined["image_name"].astype("category")
+        # one partitioning pass instead of a boolean scan of `combined` per obsid
+        groups = dict(
+            iter(combined.groupby("image_name", sort=False, observed=True))
+        )
+        empty = combined.iloc[0:0]
+        obsids = list(self.obsids)
+        # every worker only receives the markings of its own obsid
+        datas = (groups.get(obsid, empty) for obsid in obsids)
+
+        with ProcessPoolExecutor() as executor:
+            results = executor.map(
+                calc_obsid_marking_coordinates,
+                obsids,
+                datas,
+                itertools.repeat(self.savefolder),
+                itertools.repeat(self.overwrite),
+            )
+            for _ in tqdm(results, total=len(obsids)):
+                pass
 
     def collect_marking_coordinates(self):
-        bucket = []
-        for obsid in self.obsids:
+        def read_obsid_coords(obsid):
             xy = XY2LATLON(None, self.savefolder, obsid=obsid)
-            bucket.append(pd.read_csv(xy.savepath).assign(obsid=obsid))
+            return pd.read_csv(xy.savepath).assign(obsid=obsid)
+
+        # I/O bound, and the pandas C parser releases the GIL
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            bucket = list(executor.map(read_obsid_coords, self.obsids))
 
-        ground = pd.concat(bucket, sort=False).drop_duplicates()
+        ground = pd.concat(bucket, sort=False, ignore_index=True)
+        ground["obsid"] = ground["obsid"].astype("category")
+        # campt output is fully determined by the input pixel, hash only that
+        ground = ground.drop_duplicates(
+            subset=["obsid", "Sample", "Line"], ignore_index=True
+        )
         ground.rename(dict(Sample="image_x", Line="image_y"), axis=1, inplace=True)
         return ground
 
-    def fix_marking_coordinates_precision(self, df):
-        fname = "tempfile.csv"
-        df.to_csv(fname, float_format="%.7f")
-        return pd.read_csv(fname, dtype="str")
-
     def merge_campt_results(self, fans, blotches):
         INDEX = ["obsid", "image_x", "image_y"]
+        XY = ["image_x", "image_y"]
 
+        # round both sides identically, so that the float merge keys match
         ground = self.collect_marking_coordinates().round(decimals=7)
-        # ground = self.fix_marking_coordinates_precision(ground)
+        fans[XY] = fans[XY].round(decimals=7)
+        blotches[XY] = blotches[XY].round(decimals=7)
         fans = fans.merge(ground[self.COLS_TO_MERGE], on=INDEX)
         blotches = blotches.merge(ground[self.COLS_TO_MERGE], on=INDEX)
         return fans, blotches
@@ -500,24 +651,18 @@ class ReleaseManager:
 
         # perform the clustering
         if len(self.todo) > 0:
-            LOGGER.info("Performing the clustering.")
-            results = cluster_obsid_parallel(self.todo, self.catalog, self.dbname)
-
-            # create marking_ids
-            fan_id = fan_id_generator()
-            blotch_id = blotch_id_generator()
-            for obsid in self.todo:
-                paths = get_L1A_paths(obsid, self.catalog)
-                for path in paths:
-                    add_marking_ids(path, fan_id, blotch_id)
-
-            # fnotch and apply cuts
-            LOGGER.info("Start fnotching")
-            results = fnotch_obsid_parallel(self.todo, self.catalog)
+            # cluster, create marking_ids, fnotch and apply cuts
+            LOGGER.info("Performing the clustering and fnotching.")
+            results = cluster_and_fnotch_obsid_parallel(
+                self.todo, self.catalog, self.dbname
+            )
 
         # create summary CSV files of the clustering output
         LOGGER.info("Creating L1C fan and blotch database files.")
         create_roi_file(self.obsids, self.catalog, self.catalog)
+        # the ROI files were just rewritten, drop any earlier parsed copies
+        self._fans = None
+        self._blotches = None
 
         LOGGER.info("Creating the required RED45 mosaics for ground projections.")
         results = execute_in_parallel(create_RED45_mosaic, self.obsids)
@@ -585,12 +730,34 @@ class ReleaseManager:
 #     return image_name
 
 
+def write_catalog_table(df, savepath):
+    """Write catalog table `df` as csv file to `savepath`, plus a Parquet copy.
+
+    The Parquet copy next to `savepath` is for internal re-reads, the csv file is the
+    published product. The csv file stays with pandas, so that its quoting, booleans
+    and number formatting do not change between releases.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Catalog data to write.
+    savepath : pathlib.Path
+        Path for the csv file.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    pq.write_table(table, str(savepath.with_suffix(".parquet")), compression="zstd")
+    df.to_csv(savepath, index=False)
+
+
 def read_csvfiles_into_lists_of_frames(folders):
+    # pyarrow parses each file multi-threaded, pandas' C engine only uses one core.
+    read_options = pacsv.ReadOptions(use_threads=True)
     bucket = dict(fan=[], blotch=[])
     for folder in folders:
         for markingfile in folder.glob("*.csv"):
             key = "fan" if markingfile.name.endswith("fans.csv") else "blotch"
-            bucket[key].append(pd.read_csv(markingfile))
+            table = pacsv.read_csv(str(markingfile), read_options=read_options)
+            bucket[key].append(table.to_pandas(split_blocks=True, self_destruct=True))
     return bucket
 
 
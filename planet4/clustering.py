@@ -81,7 +81,7 @@ class ClusteringManager(object):
         Parameter to control the exclusion distance for the DBSCAN
     output_dir : str or pathlib.Path
         Path to folder where to store output. Default: io.data_root / 'output'
-    output_format : {'hdf', 'csv', 'both'}
+    output_format : {'hdf', 'csv', 'both', 'parquet'}
         Format to save the output in. Default: 'hdf'
     min_samples_factor : float
         Value to multiply the number of unique classifications per image_id with
@@ -359,6 +359,8 @@ class ClusteringManager(object):
                 obj.to_hdf(str(path.with_suffix('.hdf')), 'df')
             if self.output_format in ['csv', 'both']:
                 obj.to_csv(str(path.with_suffix('.csv')), index=False)
+            if self.output_format == 'parquet':
+                self.pm.write_to_dataset(obj, path)
         # obj could be NoneType if no blotches or fans were found. Catching it here.
         except AttributeError:
             pass
@@ -32,11 +32,13 @@ def main(fname, user_name='michaelaye', datadir=None):
         htmlparser.feed(f.read())
 
     dbname = io.get_current_database_fname(datadir)
-    df = pd.read_hdf(str(dbname), 'df', where='user_name={0}'.format(user_name))
+    df = pd.read_hdf(str(dbname), 'df', where='user_name=={0!r}'.format(user_name),
+                     columns=['image_id'])
+    done_ids = df.image_id.unique()
 
     check = pd.DataFrame(htmlparser.container, columns=['ids_to_test'])
 
-    check['Done'] = check.ids_to_test.isin(df.image_id)
+    check['Done'] = check.ids_to_test.isin(done_ids)
 
     if check.Done.all():
         print("All ids done.")
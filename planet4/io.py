@@ -1,33 +1,50 @@
 import configparser
 import datetime as dt
+import functools
 import logging
 import os
 import shutil
+import tempfile
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from urllib.error import URLError
 
 import dask.dataframe as dd
-import matplotlib.image as mplimg
+import numpy as np
 import pandas as pd
 import pkg_resources as pr
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import urllib3
+from PIL import Image
 from planetarypy.config import config
-from planetarypy.utils import url_retrieve
 
 from . import stats
 from .exceptions import NoFilesFoundError
 
-try:
-    from urllib import urlretrieve
-except ImportError:
-    from urllib.request import urlretrieve
-
 pkg_name = __name__.split(".")[0]
 
 configpath = Path.home() / ".{}.ini".format(pkg_name)
 
 LOGGER = logging.getLogger(__name__)
 
+# PyTables cache settings for long-lived read-only HDF stores. 64 MB of chunk
+# cache holds the chunks around a few image_ids of the cleaned database.
+HDF_CHUNK_CACHE_SIZE = 64 * 1024 * 1024
+HDF_NODE_CACHE_SLOTS = 4096
+
+
+def subframe_store_path(url):
+    "Path of the stored uint8 array for the subframe at `url`, see `store_subframe`."
+    stem = os.path.splitext(os.path.basename(url))[0]
+    return data_root / "images" / (stem + ".npy")
+
+
+# one connection pool for all subframe downloads, so that consecutive requests
+# to the image server reuse their TCP/TLS connections.
+_POOL = urllib3.PoolManager(maxsize=16, retries=3)
+
 
 def get_config():
     """Read the configfile and return config dict.
@@ -121,57 +138,206 @@ def check_and_pad_id(imgid):
     return imgid
 
 
-def get_subframe(url):
-    """Download image if not there yet and return numpy array.
+def download_subframe(url, targetpath, chunksize=1024 * 1024):
+    """Stream the image at `url` into `targetpath`.
 
-    Takes a data record (called 'line'), picks out the image_url.
-    First checks if the name of that image is already stored in
-    the image path. If not, it grabs it from the server.
-    Then uses matplotlib.image to read the image into a numpy-array
-    and finally returns it.
+    The response is written in chunks into a uniquely named `.part` file next
+    to `targetpath` and only renamed to its final name when complete. An
+    interrupted download therefore never leaves a broken image in the cache, and
+    concurrent downloads of the same url do not write into each other's file.
+
+    Parameters
+    ----------
+    url : str
+        URL of the subframe image.
+    targetpath : pathlib.Path
+        Final path for the downloaded image.
+    chunksize : int, optional
+        Buffer size in bytes for copying the response into the file.
+    """
+    r = _POOL.request("GET", url, preload_content=False)
+    try:
+        if r.status != 200:
+            raise urllib3.exceptions.HTTPError(f"Status {r.status} for {url}")
+        # same folder as the target, so that os.replace is a rename, not a copy
+        fd, partpath = tempfile.mkstemp(
+            prefix=targetpath.name + ".", suffix=".part", dir=targetpath.parent
+        )
+        try:
+            with os.fdopen(fd, "wb") as f:
+                shutil.copyfileobj(r, f, length=chunksize)
+            os.replace(partpath, targetpath)
+        except BaseException:
+            os.remove(partpath)
+            raise
+    finally:
+        r.release_conn()
+
+
+def get_cached_subframe_path(url):
+    """Return the image cache path for `url`, downloading the image if not there yet.
+
+    Returns None if the image could not be downloaded.
     """
     targetpath = data_root / "images" / os.path.basename(url)
     targetpath.parent.mkdir(exist_ok=True)
     if not targetpath.exists():
         LOGGER.info("Did not find image in cache. Downloading ...")
         try:
-            url_retrieve(url, targetpath)
-        except URLError:
+            download_subframe(url, targetpath)
+        except urllib3.exceptions.HTTPError:
             msg = "Cannot receive subframe image. No internet?"
             LOGGER.error(msg)
             return None
         LOGGER.debug("Done.")
     else:
         LOGGER.debug("Found image in cache.")
-    im = mplimg.imread(targetpath)
+    return targetpath
+
+
+@functools.lru_cache(maxsize=64)
+def _read_stored_subframe(path):
+    """Return the subframe array stored at `path`, raising KeyError if it is not there.
+
+    Kept in memory for repeated plotting of the same tile. The array is shared
+    between callers and hence read-only.
+    """
+    try:
+        im = np.load(path)
+    except FileNotFoundError:
+        raise KeyError(path)
+    im.flags.writeable = False
     return im
 
 
+def store_subframe(url):
+    """Download the subframe for `url` and store it as raw uint8 array.
+
+    An image file left in the old per-url cache folder is used instead of
+    downloading it again, and removed once stored.
+    Like `download_subframe`, the array is written to a unique temporary file
+    first and then renamed, so that concurrent threads or processes storing the
+    same url never see a partial file.
+
+    Returns
+    -------
+    bool
+        False if the image could not be downloaded.
+    """
+    storepath = subframe_store_path(url)
+    path = get_cached_subframe_path(url)
+    if path is None:
+        return False
+    try:
+        with Image.open(path) as img:
+            im = np.asarray(img.convert("RGB"))
+    except FileNotFoundError:
+        # another worker stored it and removed the image file in the meantime
+        return storepath.exists()
+    fd, temppath = tempfile.mkstemp(
+        prefix=storepath.name + ".", suffix=".part", dir=storepath.parent
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, im)
+        os.replace(temppath, storepath)
+    except BaseException:
+        os.remove(temppath)
+        raise
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    return True
+
+
+def get_subframe(url):
+    """Download image if not there yet and return numpy array.
+
+    Takes a data record (called 'line'), picks out the image_url.
+    First checks if that image is already stored as array. If not, it
+    grabs it from the server and stores it.
+    Then returns the stored uint8 RGB array, keeping the most recently used
+    ones in memory.
+    """
+    path = str(subframe_store_path(url))
+    try:
+        return _read_stored_subframe(path)
+    except KeyError:
+        LOGGER.info("Did not find image in store. Downloading ...")
+    if not store_subframe(url):
+        return None
+    return _read_stored_subframe(path)
+
+
+# for long-running sessions that want their memory back
+get_subframe.cache_clear = _read_stored_subframe.cache_clear
+
+
+def get_subframes(urls, max_workers=16):
+    """Return the images for many `urls`, downloading missing ones in parallel.
+
+    Parameters
+    ----------
+    urls : iterable of str
+        Subframe image URLs.
+    max_workers : int, optional
+        Number of concurrent downloads.
+
+    Returns
+    -------
+    dict
+        Mapping of url to numpy array, or to None if the download failed.
+    """
+    urls = list(dict.fromkeys(urls))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(zip(urls, executor.map(get_subframe, urls)))
+
+
+def get_image_from_record(line):
+    "Return the subframe image for the data record `line`."
+    return get_subframe(line.image_url.strip())
+
+
 class P4DBName:
     def __init__(self, fname):
         self.p = Path(fname)
-        date = str(self.name)[:10]
+        # the Path parts that are used, as plain attributes
+        self.name = self.p.name
+        self.stem = self.p.stem
+        self.suffix = self.p.suffix
+        self.parent = self.p.parent
+        date = self.name[:10]
         self.date = dt.datetime(*[int(i) for i in date.split("-")])
 
-    def __getattr__(self, name):
-        "looking up things in the Path object if not in `self`."
-        return getattr(self.p, name)
-
 
 def get_latest_file(filenames):
     fnames = list(filenames)
     if len(fnames) == 0:
         raise NoFilesFoundError
-    retval = P4DBName(fnames[0])
-    dtnow = retval.date
-    for fname in fnames[1:]:
-        dt_to_check = P4DBName(fname).date
-        if dt_to_check > dtnow:
-            dtnow = dt_to_check
-            retval = P4DBName(fname)
-    return retval.p
+    # file names start with an ISO date, so the string max is the latest date
+    return Path(max(fnames, key=lambda fname: Path(fname).name[:10]))
+
 
+def _cache_default_datadir(func):
+    """Memoize `func` for calls without `datadir`, i.e. the scan of `data_root`.
 
+    Other folders are searched anew on every call. Use `.cache_clear()` on the
+    decorated function to pick up database files created in the meantime.
+    """
+    cached = functools.lru_cache(maxsize=1)(lambda: func(None))
+
+    @functools.wraps(func)
+    def wrapper(datadir=None):
+        if datadir is None:
+            return cached()
+        return func(datadir)
+
+    wrapper.cache_clear = cached.cache_clear
+    return wrapper
+
+
+@_cache_default_datadir
 def get_latest_cleaned_db(datadir=None):
     datadir = data_root if datadir is None else Path(datadir)
     basestr = "201*_queryable_cleaned*"
@@ -188,6 +354,7 @@ def get_latest_cleaned_db(datadir=None):
     return get_latest_file(files)
 
 
+@_cache_default_datadir
 def get_latest_season23_dbase(datadir=None):
     if datadir is None:
         datadir = data_root
@@ -234,14 +401,17 @@ def get_image_names_from_db(dbfname):
         Array of unique image names.
     """
     path = Path(dbfname)
+    # only read the image_name column, not the whole table
     if path.suffix in [".hdf", ".h5"]:
-        return dd.read_hdf(str(path), "df").image_name.unique()
+        with pd.HDFStore(str(path), mode="r") as store:
+            image_names = store.select_column("df", "image_name")
     elif path.suffix == ".csv":
-        return dd.read_csv(path).image_name.unique()
+        image_names = pd.read_csv(path, usecols=["image_name"]).image_name
     elif path.suffix in [".parquet", ".parq"]:
-        return dd.read_parquet(path, index=False).image_name.unique()
+        image_names = pd.read_parquet(path, columns=["image_name"]).image_name
     else:
         raise UserWarning(f"Unknown suffix: {path.suffix}")
+    return image_names.unique()
 
 
 def get_latest_marked():
@@ -280,8 +450,10 @@ class PathManager:
     datapath : str or pathlib.Path, optional
         the base path from where to manage all derived paths. No default assumed
         to prevent errors.
-    suffix : {'.hdf', '.h5', '.csv'}
+    suffix : {'.hdf', '.h5', '.csv', '.parquet'}
         The suffix that controls the reader function to be used.
+        With '.parquet' all results of one data level live in a single dataset,
+        partitioned by obsid and marking, instead of one file per image_id.
     obsid : str, optional
         HiRISE obsid (i.e. P4 image_name), added as a folder inside path.
         Can be set after init.
@@ -321,9 +493,12 @@ class PathManager:
 
         # point reader to correct function depending on required suffix
         if suffix in [".hdf", ".h5"]:
-            self.reader = pd.read_hdf
+            # naming the key spares pandas walking the file's groups to find it
+            self.reader = functools.partial(pd.read_hdf, key="df", mode="r")
         elif suffix == ".csv":
             self.reader = pd.read_csv
+        elif suffix == ".parquet":
+            self.reader = self.read_from_dataset
 
         # making sure to warn the user here if the data isn't where it's expected to be
         if id_ != "":
@@ -442,6 +617,65 @@ class PathManager:
     def get_df(self, fpath):
         return self.reader(str(fpath))
 
+    def get_dataset_path(self, level):
+        "Root of the Parquet dataset holding all results of data `level`."
+        return self.datapath / self.extra_path / f"{level}.parquet"
+
+    @staticmethod
+    def _split_result_path(fpath):
+        # a result path ends in <level>/<id>_[<specific>_]<marking><suffix>
+        fpath = Path(fpath)
+        return fpath.stem.rsplit("_", 1)[-1], fpath.parent.name
+
+    # bookkeeping columns of the Parquet datasets. They are named so that they can't
+    # collide with columns of the stored results, like their own `marking`.
+    DATASET_OBSID = "dataset_obsid"
+    DATASET_KIND = "dataset_kind"
+    DATASET_ID = "dataset_id"
+
+    def read_from_dataset(self, fpath, columns=None):
+        """Read the results that `get_path` would have stored in `fpath`.
+
+        Only the partition of the current obsid and marking kind is touched, and
+        within it only the rows of the current image_id, or of the obsid level if
+        no image_id is set.
+        Without `columns`, all columns of the stored results are returned, but none
+        of the dataset's bookkeeping columns.
+        """
+        kind, level = self._split_result_path(fpath)
+        dataset = ds.dataset(
+            self.get_dataset_path(level), format="parquet", partitioning="hive"
+        )
+        id_ = self.id if self.id != "" else self.obsid
+        expr = (
+            (ds.field(self.DATASET_OBSID) == self.obsid)
+            & (ds.field(self.DATASET_KIND) == kind)
+            & (ds.field(self.DATASET_ID) == id_)
+        )
+        if columns is None:
+            bookkeeping = [self.DATASET_OBSID, self.DATASET_KIND, self.DATASET_ID]
+            columns = [c for c in dataset.schema.names if c not in bookkeeping]
+        return dataset.to_table(columns=columns, filter=expr).to_pandas()
+
+    def write_to_dataset(self, df, fpath):
+        "Store `df` in the dataset partition that `read_from_dataset` reads back."
+        kind, level = self._split_result_path(fpath)
+        id_ = self.id if self.id != "" else self.obsid
+        keys = {
+            self.DATASET_OBSID: self.obsid,
+            self.DATASET_KIND: kind,
+            self.DATASET_ID: id_,
+        }
+        df = df.assign(**keys)
+        pq.write_to_dataset(
+            pa.Table.from_pandas(df, preserve_index=False),
+            str(self.get_dataset_path(level)),
+            partition_cols=[self.DATASET_OBSID, self.DATASET_KIND],
+            # one file per id, so re-running an id replaces its previous results
+            basename_template=f"{id_}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+        )
+
     @property
     def fanfile(self):
         return self.get_path("fans", self.L1A_folder)
@@ -536,17 +770,73 @@ class DBManager:
             self.dbname = Path(get_latest_cleaned_db())
         else:
             self.dbname = Path(dbname)
-        self.df = dd.read_parquet(self.dbname)
+        self._df = None
+        self._image_names = None
+        self._image_ids = None
+        self._store = None
+        # per-instance query caches: asking again for the same obsid or tile_id
+        # does not scan the database again.
+        self.get_obsid_markings = functools.lru_cache(maxsize=8)(
+            self._get_obsid_markings
+        )
+        self.get_obsid_for_tile_id = functools.lru_cache(maxsize=256)(
+            self._get_obsid_for_tile_id
+        )
 
     def __repr__(self):
         s = "Database root: {}\n".format(Path(self.dbname).parent)
         s += "Database name: {}\n".format(Path(self.dbname).name)
         return s
 
+    @property
+    def is_hdf(self):
+        "bool : True if the database is an HDF file."
+        return Path(self.dbname).suffix in [".hdf", ".h5"]
+
+    @property
+    def df(self):
+        """dask.dataframe.DataFrame : Lazy view of the whole database.
+
+        Only created on first use, reading the HDF table or the Parquet dataset,
+        depending on the suffix of `dbname`.
+        """
+        if self._df is None:
+            if self.is_hdf:
+                self._df = dd.read_hdf(str(self.dbname), "df")
+            else:
+                self._df = dd.read_parquet(self.dbname)
+        return self._df
+
+    @property
+    def store(self):
+        """pd.HDFStore : Read-only handle on an HDF database, kept open for reuse.
+
+        Chunks read by one query stay in PyTables' chunk cache for the next one,
+        which for the image_id-sorted cleaned database is usually the same tile.
+        """
+        if self._store is None:
+            self._store = pd.HDFStore(
+                str(self.dbname),
+                mode="r",
+                CHUNK_CACHE_SIZE=HDF_CHUNK_CACHE_SIZE,
+                NODE_CACHE_SLOTS=HDF_NODE_CACHE_SLOTS,
+            )
+        return self._store
+
+    def close(self):
+        "Close the HDF store, if it was opened."
+        # getattr, because __del__ also runs if __init__ failed early
+        if getattr(self, "_store", None) is not None:
+            self._store.close()
+            self._store = None
+
+    def __del__(self):
+        self.close()
+
     def read(self, **kwargs):
         p = Path(self.dbname)
-        if p.suffix.endswith("hdf"):
-            return pd.read_hdf(p, **kwargs)
+        if self.is_hdf:
+            return self.store.select(kwargs.pop("key", "df"), **kwargs)
         elif p.suffix.endswith("parquet"):
             where = kwargs.pop("where", None)
             if where is not None:
@@ -564,7 +854,7 @@ class DBManager:
         p = self.dbname
         return p.parent / (p.name[:38] + ".csv")
 
-    def get_obsid_for_tile_id(self, tile_id):
+    def _get_obsid_for_tile_id(self, tile_id):
         tile_id = check_and_pad_id(tile_id)
         obsid = self.df[self.df.image_id == tile_id].image_name.compute().iloc[0]
         return obsid
@@ -574,7 +864,11 @@ class DBManager:
         h5files = datadir.glob("201*_queryable.h5")
         dbname = get_latest_file(h5files)
         print("Setting {} as dbname.".format(dbname.name))
+        self.close()
         self.dbname = Path(dbname)
+        self._df = None
+        self._image_names = None
+        self._image_ids = None
 
     @property
     def image_names(self):
@@ -584,12 +878,43 @@ class DBManager:
         --------
         get_image_names_from_db
         """
-        return self.df.image_name.unique().compute()
+        if self._image_names is None:
+            self._image_names = self._unique_column_values("image_name")
+        return self._image_names
 
     @property
     def image_ids(self):
         "Return list of unique image_ids in database."
-        return self.df.image_id.unique().compute()
+        if self._image_ids is None:
+            self._image_ids = self._unique_column_values("image_id")
+        return self._image_ids
+
+    def _unique_column_values(self, column):
+        """Read only `column` from the database and return its sorted unique values.
+
+        Rows without a value (None or NaN) have no name to list and are skipped.
+        """
+        p = Path(self.dbname)
+        if self.is_hdf:
+            storer = self.store.get_storer("df")
+            if column in storer.table.colnames:
+                # the raw PyTables column, without building a pandas Series first
+                values = storer.table.col(column)
+                if values.dtype.kind == "S":
+                    # decode only the uniques. pandas writes missing strings as
+                    # `nan_rep`.
+                    values = np.char.decode(np.unique(values), "utf-8")
+                    values = values[values != getattr(storer, "nan_rep", "nan")]
+                    return values.astype(object)
+            else:
+                # not a data column, pandas has to take it out of its values block
+                values = self.store.select("df", columns=[column])[column].to_numpy()
+        else:
+            values = pq.read_table(p, columns=[column]).column(column)
+            if pa.types.is_dictionary(values.type):
+                values = values.cast(values.type.value_type)
+            values = values.to_numpy()
+        return np.unique(values[pd.notna(values)])
 
     @property
     def n_image_ids(self):
@@ -604,8 +929,14 @@ class DBManager:
         "Alias to self.image_names."
         return self.image_names
 
-    def get_obsid_markings(self, obsid):
-        "Return marking data for given HiRISE obsid."
+    def _get_obsid_markings(self, obsid):
+        """Return marking data for given HiRISE obsid.
+
+        Cached per instance as `get_obsid_markings`, don't modify the result in place.
+        """
+        if self.is_hdf:
+            # image_name is an indexed data column of the HDF databases
+            return self.read(where="image_name=={!r}".format(obsid))
         return self.df[self.df.image_name == obsid].compute()
 
     def get_image_name_markings(self, image_name):
@@ -621,10 +952,17 @@ class DBManager:
         return data.query("image_id==@image_id")
 
     def get_data_for_obsids(self, obsids):
-        bucket = []
-        for obsid in obsids:
-            bucket.append(self.get_obsid_markings(obsid))
-        return pd.concat(bucket, ignore_index=True)
+        "Return marking data for all `obsids`, selected in one pass over the database."
+        obsids = sorted(set(obsids))
+        if self.is_hdf:
+            # a where clause with many image_names is too long for PyTables, select
+            # the row coordinates from the image_name column instead.
+            image_names = self.store.select_column("df", "image_name")
+            rows = np.flatnonzero(image_names.isin(obsids).to_numpy())
+            data = self.store.select("df", where=rows)
+        else:
+            data = self.df[self.df.image_name.isin(obsids)].compute()
+        return data.reset_index(drop=True)
 
     def get_classification_id_data(self, class_id):
         "Return data for one classification_id"
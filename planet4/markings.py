@@ -23,6 +23,12 @@ from .exceptions import NoFilesFoundError
 
 LOGGER = logging.getLogger(__name__)
 
+try:
+    from numba import njit
+except ImportError:
+    LOGGER.debug("numba not available, rotating vectors with numpy.")
+    njit = None
+
 IMG_X_SIZE = 840
 IMG_Y_SIZE = 648
 
@@ -63,11 +69,19 @@ def set_upper_left_corner(ul_x, ul_y):
 
 
 def diffangle(v1, v2, rads=True):
-    """ Returns the angle in radians between vectors 'v1' and 'v2'."""
-    cosang = np.dot(v1, v2)
-    sinang = LA.norm(np.cross(v1, v2))
+    """ Returns the angle in radians between vectors 'v1' and 'v2'.
+
+    Stacks of vectors with shape (M, 2) or (M, 3) give M angles.
+    """
+    v1 = np.asarray(v1, dtype='float')
+    v2 = np.asarray(v2, dtype='float')
+    cosang = np.sum(v1 * v2, axis=-1)
+    if v1.shape[-1] == 2:
+        sinang = np.abs(v1[..., 0] * v2[..., 1] - v1[..., 1] * v2[..., 0])
+    else:
+        sinang = LA.norm(np.cross(v1, v2), axis=-1)
     res = np.arctan2(sinang, cosang)
-    return res if rads else degrees(res)
+    return res if rads else np.degrees(res)
 
 
 def set_subframe_size(ax):
@@ -99,6 +113,7 @@ class TileID:
         self.scope = scope
         self.dbname = dbname
         self._image_name = image_name
+        self._subframe = None
 
     @property
     def data(self):
@@ -138,8 +153,11 @@ class TileID:
     @property
     def subframe(self):
         "np.array : Get tile url and return image tile using io funciton."
-        url = self.data.iloc[0].image_url
-        return io.get_subframe(url)
+        # decode only once, all `show_subframe` calls share this array.
+        if self._subframe is None:
+            url = self.data.iloc[0].image_url
+            self._subframe = io.get_subframe(url)
+        return self._subframe
 
     def filter_data(self, kind, user_name=None, without_users=None):
         """Filter and return data for kind, user, or without_users.
@@ -227,10 +245,13 @@ class TileID:
         with_center, user_name, without_users, lw = self.pop_kwargs(kwargs)
         if data is None:
             data = self.filter_data(kind, user_name, without_users)
-        markingClass = Blotch if kind == 'blotch' else Fan
         if type(data) == pd.core.frame.DataFrame:
-            data = [markingClass(i, self.scope, with_center=with_center, lw=lw)
-                    for _, i in data.iterrows()]
+            if kind == 'blotch':
+                data = [Blotch(i, self.scope, with_center=with_center, lw=lw)
+                        for _, i in data.iterrows()]
+            else:
+                data = Fan.from_dataframe(data, self.scope,
+                                          with_center=with_center, lw=lw)
         self.plot_objects(data, **kwargs)
 
     def plot_blotches(self, data=None, **kwargs):
@@ -418,20 +439,67 @@ class HiBlotch(Blotch):
         super().__init__(*args, scope='hirise', **kwargs)
 
 
+if njit is not None:
+    @njit(cache=True)
+    def _rotate_vectors_batch(vs, angles):
+        "Rotate each row of `vs` by the matching entry of `angles` in degrees."
+        out = np.empty_like(vs)
+        for i in range(vs.shape[0]):
+            a = math.radians(angles[i])
+            c = math.cos(a)
+            s = math.sin(a)
+            out[i, 0] = c * vs[i, 0] - s * vs[i, 1]
+            out[i, 1] = s * vs[i, 0] + c * vs[i, 1]
+        return out
+else:
+    _rotate_vectors_batch = None
+
+
 def rotate_vector(v, angle):
     """Rotate vector by angle given in degrees.
 
     Parameters
     ----------
     v : np.array
-        Vector to be rotated
-    angle : float
-        Angle in degrees
+        Vector to be rotated, or stack of vectors with shape (M, 2)
+    angle : float or np.array
+        Angle in degrees, or M angles, one per vector
     """
-    rangle = radians(angle)
-    rotmat = np.array([[cos(rangle), -sin(rangle)],
-                       [sin(rangle), cos(rangle)]])
-    return rotmat.dot(v)
+    v = np.asarray(v, dtype='float')
+    if _rotate_vectors_batch is not None and v.ndim == 2:
+        angles = np.broadcast_to(np.asarray(angle, dtype='float'), v.shape[:1])
+        return _rotate_vectors_batch(np.ascontiguousarray(v),
+                                     np.ascontiguousarray(angles))
+    rangle = np.radians(angle)
+    c, s = np.cos(rangle), np.sin(rangle)
+    x, y = v[..., 0], v[..., 1]
+    return np.stack((c * x - s * y, s * x + c * y), axis=-1)
+
+
+def fan_arms(data):
+    """Calculate arm length and both arm vectors for all fans in `data` at once.
+
+    Parameters
+    ----------
+    data : pd.DataFrame or pd.Series
+        providing `angle`, `spread` and `distance`
+
+    Returns
+    -------
+    armlength : np.array
+    v1, v2 : np.array
+        arm vectors, with shape (M, 2) for M fans in a DataFrame
+    """
+    angle = np.asarray(data.angle, dtype='float')
+    inside_half = np.asarray(data.spread, dtype='float') / 2.0
+    half = np.radians(inside_half)
+    distance = np.asarray(data.distance, dtype='float')
+    # [()] turns the 0-d result for a single fan back into a plain scalar
+    armlength = (distance / (np.cos(half) + np.sin(half)))[()]
+    arm = np.stack((armlength, np.zeros_like(armlength)), axis=-1)
+    v1 = rotate_vector(arm, angle - inside_half)
+    v2 = rotate_vector(arm, angle + inside_half)
+    return armlength, v1, v2
 
 
 class Fan(lines.Line2D):
@@ -444,6 +512,9 @@ class Fan(lines.Line2D):
         object has to provide [`x`, `y`, `angle`, `spread`, `distance`]
     scope : {'planet4', 'hirise'}
         string that decides between using x/y or image_x/image_y as base coords
+    arms : tuple, optional
+        Precalculated (armlength, v1, v2) for this fan, see `fan_arms`.
+        `from_dataframe` uses this to do the trigonometry for many fans at once.
     kwargs : dictionary, optional
 
     Attributes
@@ -473,7 +544,7 @@ class Fan(lines.Line2D):
 
     to_average = 'x y image_x image_y angle spread distance'.split()
 
-    def __init__(self, data, scope='planet4', with_center=False, **kwargs):
+    def __init__(self, data, scope='planet4', with_center=False, arms=None, **kwargs):
         self.data = data
         self.scope = scope if scope is not None else 'planet4'
         self.with_center = with_center
@@ -492,14 +563,10 @@ class Fan(lines.Line2D):
         self._n_members = 1
         # angles
         self.inside_half = self.data.spread / 2.0
-        alpha = self.data.angle - self.inside_half
-        beta = self.data.angle + self.inside_half
-        # length of arms
-        self.armlength = self.get_arm_length()
-        # first arm
-        self.v1 = rotate_vector([self.armlength, 0], alpha)
-        # second arm
-        self.v2 = rotate_vector([self.armlength, 0], beta)
+        if arms is None:
+            arms = fan_arms(self.data)
+        # length of arms, first arm, second arm
+        self.armlength, self.v1, self.v2 = arms
         # vector matrix, stows the 1D vectors row-wise
         self.coords = np.vstack((self.base + self.v1,
                                  self.base,
@@ -509,6 +576,19 @@ class Fan(lines.Line2D):
                               alpha=0.65, color='white',
                               **kwargs)
 
+    @classmethod
+    def from_dataframe(cls, df, scope='planet4', with_center=False, **kwargs):
+        """Create Fan objects for all rows of `df`.
+
+        The arm geometry is calculated for all fans in one go instead of
+        per fan.
+        """
+        armlengths, v1s, v2s = fan_arms(df)
+        return [cls(row, scope, with_center=with_center,
+                    arms=(armlength, v1, v2), **kwargs)
+                for (_, row), armlength, v1, v2
+                in zip(df.iterrows(), armlengths, v1s, v2s)]
+
     def is_equal(self, other):
         if self.data.x == other.data.x and\
            self.data.y == other.data.y and\
@@ -530,8 +610,7 @@ class Fan(lines.Line2D):
         self._n_members = value
 
     def get_arm_length(self):
-        half = radians(self.inside_half)
-        return self.data.distance / (cos(half) + sin(half))
+        return fan_arms(self.data)[0]
 
     @property
     def area(self):
@@ -1,19 +1,37 @@
 from __future__ import print_function, division
 from .io import get_image_from_record
 import os
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
-from itertools import cycle
-from matplotlib.patches import Ellipse
+from itertools import cycle, islice
+from matplotlib.collections import EllipseCollection
 import sys
 
 data_root = '/Users/maye/data/planet4'
 
 
+def marked_to_parquet():
+    """Convert marked.h5 once into a Parquet file sorted by image_id.
+
+    With the rows sorted, the row-group statistics are selective for
+    image_id, so reading one image_id only touches the row groups holding it.
+    """
+    data = pd.read_hdf(os.path.join(data_root, 'marked.h5'), 'df')
+    data = data.sort_values('image_id', kind='mergesort')
+    data.to_parquet(os.path.join(data_root, 'marked.parquet'), index=False,
+                    row_group_size=100000)
+
+
 def data_munging(_id):
     print("Reading current marked data.")
-    data = pd.read_hdf(os.path.join(data_root, 'marked.h5'), 'df',
-                       where='image_id=='+_id)
+    parquetpath = os.path.join(data_root, 'marked.parquet')
+    if os.path.exists(parquetpath):
+        data = pd.read_parquet(parquetpath,
+                               filters=[('image_id', '==', _id)])
+    else:
+        data = pd.read_hdf(os.path.join(data_root, 'marked.h5'), 'df',
+                           where='image_id=={!r}'.format(_id))
     print("Done.")
     return data
 
@@ -39,14 +57,18 @@ def get_image_name_from_data(data):
 
 
 def add_ellipses_to_axis(ax, blotches):
-    colors = cycle('bgrcmyk')
-    for i, color in zip(range(len(blotches),), colors):
-        line = blotches.iloc[i]
-        ax.scatter(line.x, line.y, color=color)
-        el = Ellipse((line.x, line.y),
-                     line.radius_1, line.radius_2, line.angle,
-                     fill=False, color=color, linewidth=1)
-        ax.add_artist(el)
+    """Add all blotches as one scatter and one ellipse collection to `ax`."""
+    colors = list(islice(cycle('bgrcmyk'), len(blotches)))
+    xy = np.column_stack([blotches.x.values, blotches.y.values])
+    ax.scatter(xy[:, 0], xy[:, 1], c=colors)
+    ellipses = EllipseCollection(blotches.radius_1.values,
+                                 blotches.radius_2.values,
+                                 blotches.angle.values,
+                                 units='xy', offsets=xy,
+                                 offset_transform=ax.transData,
+                                 facecolors='none', edgecolors=colors,
+                                 linewidths=1)
+    ax.add_collection(ellipses)
 
 
 def plot_blotches(data, _id):
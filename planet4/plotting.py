@@ -66,20 +66,31 @@ def plot_image_id_pipeline(
     # min_samples = 'no_log'
 
     n_classifications = imgid.n_marked_classifications
-    fig, axes = plt.subplots(nrows=2, ncols=3, figsize=figsize, constrained_layout=True)
+    fig, axes = plt.subplots(
+        nrows=2,
+        ncols=3,
+        figsize=figsize,
+        constrained_layout=True,
+        sharex=True,
+        sharey=True,
+    )
     axes = axes.ravel()
+    # every axis gets the tile background here, from the one decoded subframe of
+    # `imgid`, so the marking plotters below are told not to draw it again.
     for ax in axes:
         imgid.show_subframe(ax=ax)
-    imgid.plot_fans(ax=axes[1])
-    imgid.plot_blotches(ax=axes[2])
+    imgid.plot_fans(ax=axes[1], img=False)
+    imgid.plot_blotches(ax=axes[2], img=False)
 
     n_clust_fans = plot_clustered_markings(
-        image_id, "fan", ax=axes[4], datapath=datapath, **kwargs
+        image_id, "fan", ax=axes[4], datapath=datapath, img=False, **kwargs
     )
     n_clust_blotches = plot_clustered_markings(
-        image_id, "blotch", ax=axes[5], datapath=datapath, **kwargs
+        image_id, "blotch", ax=axes[5], datapath=datapath, img=False, **kwargs
+    )
+    plot_finals(
+        image_id, ax=axes[3], datapath=datapath, via_obsid=via_obsid, img=False
     )
-    plot_finals(image_id, ax=axes[3], datapath=datapath, via_obsid=via_obsid)
 
     # for ax in axes:
     #     ax.set_axis_off()
@@ -226,9 +237,13 @@ def fans_all(id_, datapath=None):
     )
 
 
-def get_tile_image(df, xtile, ytile):
+def get_tile_url(df, xtile, ytile):
     filtered = df.query("x_tile=={} and y_tile=={}".format(xtile, ytile))
-    return io.get_subframe(filtered.image_url.iloc[0])
+    return filtered.image_url.iloc[0]
+
+
+def get_tile_image(df, xtile, ytile):
+    return io.get_subframe(get_tile_url(df, xtile, ytile))
 
 
 def get_four_tiles_df(df, x0, y0):
@@ -240,12 +255,15 @@ def get_four_tiles_df(df, x0, y0):
 
 def get_four_tiles_img(obsid, x0, y0):
     df = io.DBManager().get_image_name_markings(obsid)
-    tiles = []
+    urls = []
     # loop along columns (= to the right)
     for xtile in [x0, x0 + 1]:
         # loop along rows (= down)
         for ytile in [y0, y0 + 1]:
-            tiles.append(get_tile_image(df, xtile, ytile))
+            urls.append(get_tile_url(df, xtile, ytile))
+    # fetch all four in one go, missing ones are downloaded concurrently
+    images = io.get_subframes(urls)
+    tiles = [images[url] for url in urls]
 
     # tiles[0] and tiles[1] are the left most tiles
     # we have overlap of 100 pixels in all directions
@@ -2,17 +2,20 @@
 from __future__ import division, print_function
 
 import argparse
+import functools
 import logging
 import os
 import sys
 import time
 from pathlib import Path
 
+import dask
 import dask.dataframe as dd
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
 import pyarrow.parquet as pq
-from dask.distributed import Client as DaskClient
 from ipyparallel import Client
 from tqdm import tqdm
 
@@ -61,6 +64,47 @@ data_columns = [
     "local_mars_time",
 ]
 
+categorical_columns = ["image_id", "image_name", "marking", "user_name"]
+
+# repetitive string columns that are parsed straight into categoricals
+csv_categorical_columns = categorical_columns + ["image_url", "local_mars_time"]
+
+# narrower storage dtypes for the numeric columns. Tile numbers are small integers
+# and float32 still resolves 1/100 of a pixel across a whole HiRISE image.
+storage_dtypes = dict(
+    x_tile="int16",
+    y_tile="int16",
+    **dict.fromkeys(
+        "x y image_x image_y radius_1 radius_2 distance angle spread version".split()
+        + ["x_angle", "y_angle"],
+        "float32",
+    ),
+)
+
+# column types for parsing the csv dump, so that types don't depend on the
+# first block. The categorical columns arrive as dictionaries = categoricals.
+csv_column_types = dict.fromkeys(analysis_cols, pa.float64())
+csv_column_types.update(
+    dict.fromkeys(["classification_id", "created_at", "acquisition_date"], pa.string())
+)
+csv_column_types.update(
+    dict.fromkeys(csv_categorical_columns, pa.dictionary(pa.int32(), pa.string()))
+)
+
+# string columns of an appended HDF table are as wide as in its first chunk,
+# leave enough room for the longer ones that may come in later chunks.
+HDF_STRING_ITEMSIZE = {"values": 128}
+
+# compression for all HDF files written here. blosc:lz4 decompresses faster than
+# the disk delivers, so reads get cheaper rather than slower.
+HDF_KW = dict(complib="blosc:lz4", complevel=3)
+
+
+def drop_empty_lines(df):
+    "Remove the empty lines of the dump, which have neither marking nor tile."
+    empty = df[["marking", "x_tile", "y_tile"]].isna().all(axis=1)
+    return df[~empty.to_numpy()].reset_index(drop=True)
+
 
 def filter_data(df):
     """scan for incomplete data and remove from dataframe.
@@ -68,70 +112,85 @@ def filter_data(df):
     This only will work if missing data has been converted to np.NANs.
     """
 
-    # split data into this marking and NOT this marking.
-    fans = df[df.marking == "fan"]
-    blotches = df[df.marking == "blotch"]
-    rest = df[(df.marking != "fan") & (df.marking != "blotch")]
-
-    # first drop incomplete data
-    fans = fans.dropna(how="any", subset=fan_data_cols)
-    blotches = blotches.dropna(how="any", subset=blotch_data_cols)
+    # one boolean mask over the whole frame, instead of splitting it by marking
+    is_fan = (df.marking == "fan").to_numpy()
+    is_blotch = (df.marking == "blotch").to_numpy()
+    is_none = (df.marking == "none").to_numpy()
 
-    # now filter for default data
-    eps = 0.00001
-    bzero_filter = (blotches.x.abs() < eps) & (blotches.y.abs() < eps)
-    fzero_filter = (fans.x.abs() < eps) & (fans.y.abs() < eps)
-    rest_zero_filter = (rest.x.abs() < eps) & (rest.y.abs() < eps)
-    blotch_defaults = ((blotches.radius_1 - 10) < eps) & (
-        (blotches.radius_2 - 10).abs() < eps
-    )
-    fan_defaults = (fans.angle.abs() < eps) & ((fans.distance - 10).abs() < eps)
+    # incomplete data
+    fan_complete = df[fan_data_cols].notna().all(axis=1).to_numpy()
+    blotch_complete = df[blotch_data_cols].notna().all(axis=1).to_numpy()
 
-    fans = fans[~(fzero_filter & fan_defaults)]
+    x, y = df.x.to_numpy(), df.y.to_numpy()
+    angle, spread = df.angle.to_numpy(), df.spread.to_numpy()
+    distance = df.distance.to_numpy()
+    radius_1, radius_2 = df.radius_1.to_numpy(), df.radius_2.to_numpy()
 
+    # default data
+    eps = 0.00001
+    zero = (np.abs(x) < eps) & (np.abs(y) < eps)
+    blotch_defaults = zero & ((radius_1 - 10) < eps) & (np.abs(radius_2 - 10) < eps)
+    fan_defaults = zero & (np.abs(angle) < eps) & (np.abs(distance - 10) < eps)
     # added a second fan default filter:
     fan_defaults2 = (
-        ((fans.angle.abs() - 90.0) < eps)
-        & ((fans.spread - 2.017450) < eps)
-        & ((fans.distance - 10) < eps)
+        ((np.abs(angle) - 90.0) < eps)
+        & ((spread - 2.017450) < eps)
+        & ((distance - 10) < eps)
     )
-    fans = fans[~fan_defaults2]
-    blotches = blotches[~(bzero_filter & blotch_defaults)]
-    rest = rest[~rest_zero_filter]
-
-    # merge previously splitted together and return
-    df = pd.concat([fans, blotches, rest], ignore_index=True)
 
-    none = df[df.marking == "none"]
-    rest = df[df.marking != "none"]
+    keep = np.where(
+        is_fan,
+        fan_complete & ~fan_defaults & ~fan_defaults2,
+        np.where(is_blotch, blotch_complete & ~blotch_defaults, ~zero),
+    )
 
-    # filter out markings outside tile frame
+    # filter out markings outside tile frame, except for 'none' markings.
     # delta value is how much I allow x and y positions to be outside the
     # planet4 tile
     delta = 25
-    q = "{} < x < {} and {} < y < {}".format(
-        -delta, markings.IMG_X_SIZE + delta, -delta, markings.IMG_Y_SIZE + delta
+    in_frame = np.logical_and.reduce(
+        [
+            x > -delta,
+            x < markings.IMG_X_SIZE + delta,
+            y > -delta,
+            y < markings.IMG_Y_SIZE + delta,
+        ]
     )
-
-    rest = rest.query(q)
-    return pd.concat([rest, none], ignore_index=True)
+    keep &= in_frame | is_none
+    return df[keep].reset_index(drop=True)
 
 
 def convert_times(df):
     logger.info("Starting time conversion now.")
     df.acquisition_date = pd.to_datetime(df.acquisition_date)
-    df.created_at = pd.to_datetime(df.created_at, format="%Y-%m-%d %H:%M:%S %Z")
+    # all created_at stamps end in " UTC": cutting that off lets the C parser
+    # handle the fixed format, instead of resolving the %Z zone name per row.
+    df.created_at = pd.to_datetime(
+        df.created_at.str.slice(0, 19), format="%Y-%m-%d %H:%M:%S", utc=True
+    )
     logger.info("Time conversions done.")
 
 
-def splitting_tutorials(rootpath, df):
+def get_tutorials_fpath(rootpath):
+    return "{}_tutorials.h5".format(rootpath)
+
+
+def splitting_tutorials(rootpath, df, append=False):
     logger.info("Splitting off tutorials now.")
     tutorials = df[df.image_name == "tutorial"]
-    tutfpath = "{}_tutorials.h5".format(rootpath)
+    tutfpath = get_tutorials_fpath(rootpath)
     tutorials = tutorials.drop(
         ["image_id", "image_url", "image_name", "local_mars_time"], axis=1
     )
-    tutorials.to_hdf(tutfpath, "df", format="t")
+    convert_categories_to_objects(tutorials)
+    tutorials.to_hdf(
+        tutfpath,
+        "df",
+        format="t",
+        append=append,
+        min_itemsize=HDF_STRING_ITEMSIZE,
+        **HDF_KW,
+    )
 
     logger.info("Tutorial split done.\nCreated %s.", tutfpath)
     return df[df.image_name != "tutorial"]
@@ -140,7 +199,7 @@ def splitting_tutorials(rootpath, df):
 def produce_fast_read(rootpath, df):
     logger.info("Now writing fixed format datafile for " "fast read-in of all data.")
     newfpath = "{0}_fast_all_read.h5".format(rootpath)
-    df.to_hdf(newfpath, "df")
+    df.to_hdf(newfpath, "df", format="fixed", **HDF_KW)
     logger.info("Created %s.", newfpath)
 
 
@@ -154,14 +213,17 @@ def convert_ellipse_angles(df):
     """
     logger.info("Converting ellipse angles.")
 
-    blotchindex = df.marking == "blotch"
-    radindex = df.radius_1 < df.radius_2
+    blotchindex = (df.marking == "blotch").to_numpy()
+    radindex = (df.radius_1 < df.radius_2).to_numpy()
     both = blotchindex & radindex
     col_orig = ["radius_1", "radius_2"]
     col_reversed = ["radius_2", "radius_1"]
     df.loc[both, col_orig] = df.loc[both, col_reversed].values
-    df.loc[both, "angle"] += 90
-    df.loc[blotchindex, "angle"] = df.loc[blotchindex, "angle"] % 180
+    # one pass over the plain angle array, without pandas index alignment
+    angle = df["angle"].to_numpy(dtype="float", copy=True)
+    angle[both] += 90
+    np.mod(angle, 180, out=angle, where=blotchindex)
+    df["angle"] = angle
     logger.info("Conversion of ellipse angles done.")
 
 
@@ -169,21 +231,31 @@ def normalize_fan_angles(df):
     """Convert -180..180 angles to 0..360"""
     logger.info("Normalizing fan angles.")
 
-    rowindex = df.marking == "fan"
-    df.loc[rowindex, "angle"] = df.loc[rowindex, "angle"] % 360
+    rowindex = (df.marking == "fan").to_numpy()
+    angle = df["angle"].to_numpy(dtype="float", copy=True)
+    np.mod(angle, 360, out=angle, where=rowindex)
+    df["angle"] = angle
     logger.info("Normalizing of fan angles done.")
 
 
 def calculate_hirise_pixels(df):
+    "Return a copy of `df` with the columns hirise_x and hirise_y added."
     logger.info("Calculating and assigning hirise pixel coordinates")
-    df = df.assign(
-        hirise_x=lambda row: (row.x + 740 * (row.x_tile - 1)).round(),
-        hirise_y=lambda row: (row.y + 548 * (row.y_tile - 1)).round(),
-    )
+    # a shallow copy is enough to add columns without touching the caller's frame
+    df = df.copy(deep=False)
+    # the tiles overlap, so neighbouring tiles start 740 and 548 pixels apart
+    for coord, tile_offset in [("x", 740), ("y", 548)]:
+        out = df[f"{coord}_tile"].to_numpy(dtype="float", copy=True)
+        out -= 1
+        out *= tile_offset
+        out += df[coord].to_numpy()
+        np.rint(out, out=out)
+        df[f"hirise_{coord}"] = out
     logger.info("Hirise pixels coords added.")
     return df
 
 
+@functools.lru_cache(maxsize=None)
 def get_temp_fname(image_name, root=None):
     if root is None:
         root = data_root
@@ -193,11 +265,11 @@ def get_temp_fname(image_name, root=None):
 def get_image_names(dbname):
     logger.info("Reading image_names from disk.")
     if Path(dbname).suffix in [".hdf", ".h5"]:
-        store = pd.HDFStore(dbname)
-        image_names = store.select_column("df", "image_name").unique()
+        with pd.HDFStore(str(dbname), mode="r") as store:
+            image_names = store.select_column("df", "image_name").unique()
     elif Path(dbname).suffix in [".parq", ".parquet"]:
-        ddf = dd.read_parquet(dbname)
-        image_names = ddf.image_name.unique()
+        df = pd.read_parquet(dbname, columns=["image_name"])
+        image_names = df.image_name.unique()
     logger.info("Got image_names")
     return image_names
 
@@ -208,6 +280,60 @@ def get_cleaned_dbname(dbname):
     return dbname.with_name(newname)
 
 
+def convert_to_categories(df, columns=None):
+    """Cast the highly repetitive string columns of `df` to categoricals in place.
+
+    Stored as integer codes they take a fraction of the space, on disk and in memory,
+    and equality filters on them become integer compares.
+    """
+    if columns is None:
+        columns = categorical_columns
+    for col in columns:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+
+
+def index_image_name(store):
+    """Index the image_name column of the "df" table in the open HDF `store`.
+
+    image_name is the only column this module queries with `where`, the other
+    data columns stay queryable without paying for an index build each.
+    """
+    store.create_table_index("df", columns=["image_name"], optlevel=6, kind="medium")
+
+
+def write_cleaned_db(df, fname):
+    """Write the cleaned database to HDF, laid out for per-image_id reads.
+
+    Rows are sorted by image_id so that one tile's markings sit in neighbouring
+    chunks, and `expectedrows` lets PyTables pick a chunkshape sized for the whole
+    table instead of its small default.
+    """
+    convert_to_categories(df)
+    df = df.sort_values(["image_id", "classification_id"], kind="stable")
+    df.reset_index(drop=True, inplace=True)
+    with pd.HDFStore(str(fname), mode="w") as store:
+        store.append(
+            "df",
+            df,
+            format="table",
+            data_columns=data_columns,
+            expectedrows=len(df),
+            index=False,
+            **HDF_KW,
+        )
+        index_image_name(store)
+
+
+def convert_categories_to_objects(df):
+    """Cast the categorical columns of `df` back to plain objects, in place.
+
+    Chunks appended to the same HDF table may not differ in their categories.
+    """
+    for col in df.select_dtypes("category").columns:
+        df[col] = df[col].astype(object)
+
+
 def merge_temp_files(dbname, image_names=None):
     logger.info("Merging temp files manually.")
 
@@ -216,48 +342,43 @@ def merge_temp_files(dbname, image_names=None):
 
     dbnamenew = get_cleaned_dbname(dbname)
     logger.info("Creating concatenated db file %s", dbnamenew)
-    df = []
-    for image_name in image_names:
-        try:
-            df.append(
-                pd.read_hdf(get_temp_fname(image_name, dbname.parent), "df", mode="r")
+    # append the temp files one by one, so the merged database is never in memory.
+    with pd.HDFStore(str(dbnamenew), mode="w") as store:
+        for image_name in image_names:
+            fname = get_temp_fname(image_name, dbname.parent)
+            try:
+                df = pd.read_hdf(fname, "df", mode="r")
+            except OSError:
+                continue
+            # whole image_names in turn, so the rows of an image_id stay together
+            df = df.sort_values(["image_id", "classification_id"], kind="stable")
+            convert_categories_to_objects(df)
+            store.append(
+                "df",
+                df,
+                format="table",
+                data_columns=data_columns,
+                min_itemsize=HDF_STRING_ITEMSIZE,
+                index=False,
+                **HDF_KW,
             )
-        except OSError:
-            continue
-        else:
-            os.remove(get_temp_fname(image_name, dbname.parent))
-    df = pd.concat(df, ignore_index=True)
-
-    df.to_hdf(str(dbnamenew), "df", format="table", data_columns=data_columns)
+            os.remove(fname)
+        if "df" in store:
+            index_image_name(store)
     logger.info("Duplicates removal complete.")
     return dbnamenew
 
 
-# def remove_duplicates(df):
-#     logger.info('Removing duplicates.')
-
-#     image_names = df.image_name.unique()
+def remove_duplicates(df):
+    """Remove repeated classifications of an image_id by the same user_name.
 
-#     def process_image_name(image_name):
-#         data = df[df.image_name == image_name]
-#         data = remove_duplicates_from_image_name_data(data)
-#         data.to_hdf(get_temp_fname(image_name), 'df')
-
-#     # parallel approach, u need to launch an ipcluster/controller for this work!
-#     lbview = setup_parallel()
-#     lbview.map_sync(process_image_name, image_names)
-
-#     df = []
-#     for image_name in image_names:
-#         try:
-#             df.append(pd.read_hdf(get_temp_fname(image_name), 'df'))
-#         except OSError:
-#             continue
-#         else:
-#             os.remove(get_temp_fname(image_name))
-#     df = pd.concat(df, ignore_index=True)
-#     logger.info('Duplicates removal complete.')
-#     return df
+    Works on the whole database at once, see
+    `remove_duplicates_from_image_name_data`.
+    """
+    logger.info("Removing duplicates.")
+    df = remove_duplicates_from_image_name_data(df)
+    logger.info("Duplicates removal complete.")
+    return df
 
 
 def display_multi_progress(results, objectlist, sleep=1):
@@ -296,59 +417,69 @@ def remove_duplicates_from_image_name_data(data):
     any later in time classification_ids per user_name and image_id.
     """
 
-    c_ids = []
+    keys = ["image_id", "user_name"]
+    # rows without user_name or image_id are dropped, as the groupby over `keys`
+    # of earlier versions did.
+    ordered = data.dropna(subset=keys)
+    # after sorting, the first row per key is from the earliest created_at, and
+    # for equal created_at from the smallest classification_id.
+    ordered = ordered.sort_values(keys + ["created_at", "classification_id"])
+    c_ids = ordered.classification_id[first_of_runs(ordered, keys)]
+    return data[data.classification_id.isin(c_ids)].reset_index(drop=True)
 
-    def process_user_group(g):
-        c_ids.append(g[g.created_at == g.created_at.min()].classification_id.min())
 
-    data.groupby(["image_id", "user_name"], sort=False).apply(process_user_group)
-    return data.set_index("classification_id").loc[set(c_ids)].reset_index()
+def first_of_runs(df, columns):
+    """Return boolean mask of the rows where the values of `columns` change.
 
+    For `df` sorted by `columns` this marks the first row of every key, like
+    `drop_duplicates(columns)` does, but by comparing neighbours instead of hashing.
+    """
+    new_run = np.zeros(len(df), dtype=bool)
+    new_run[:1] = True
+    for col in columns:
+        values = df[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.cat.codes
+        values = values.to_numpy()
+        isna = pd.isna(values)
+        same = (values[1:] == values[:-1]) | (isna[1:] & isna[:-1])
+        new_run[1:] |= ~same
+    return new_run
 
-def remove_duplicates_from_file(dbname):
-    logger.info("Removing duplicates.")
 
-    image_names = get_image_names(dbname)
+def remove_duplicates_from_file(dbname):
     dbname = Path(dbname)
-    ddf = dd.read_parquet(dbname)
-
-    def process_image_name(image_name):
-        data = ddf[ddf.image_name == image_name]
-        tmp = remove_duplicates_from_image_name_data(data)
-        # data.to_hdf(get_temp_fname(image_name, dbname.parent), 'df')
-        return tmp
-
-    client = Client()
-    logger.info("Starting parallel processing.")
-    logger.info("Done clean up. Now concatenating results.")
-    all_df = pd.concat(results, ignore_index=True)
+    logger.info("Reading %s.", dbname)
+    if dbname.suffix in [".hdf", ".h5"]:
+        df = pd.read_hdf(str(dbname), "df", mode="r")
+    else:
+        df = pd.read_parquet(dbname)
+    df = remove_duplicates(df)
     logger.info("Writing cleaned database file.")
-    all_df.to_hdf(
-        get_cleaned_dbname(dbname), "df", format="table", data_columns=data_columns
-    )
-    # merge_temp_files(dbname, image_names)
+    write_cleaned_db(df, get_cleaned_dbname(dbname))
     logger.info("Done.")
 
 
 def remove_duplicates_parquet(singlefile, dataset):
     logger.info("Removing duplicates.")
-    image_names = get_image_names(singlefile)
-
-    def process_image_name(image_name):
-        f = ("image_name", "==", image_name)
-        data = pq.read_table(dataset, filters=[f]).to_pandas()
-        return remove_duplicates_from_image_name_data(data)
-
-    client = DaskClient()
+    # read the dataset once and hand the in-memory rows of each image_name to
+    # the workers, instead of every worker re-scanning the dataset for its image.
+    df = pq.read_table(dataset).to_pandas()
+    groups = df.groupby("image_name", sort=False, observed=True).indices
+    # an explicit name, otherwise dask hashes the whole frame to name it
+    data = dask.delayed(df, name=f"remove-duplicates-input-{Path(dataset).name}")
 
     lazy_results = []
-    for image_name in image_names:
-        lazy_result = dask.delayed(process_image_name)(image_name)
+    for rows in groups.values():
+        lazy_result = dask.delayed(remove_duplicates_from_image_name_data)(
+            data.iloc[rows]
+        )
         lazy_results.append(lazy_result)
 
-    futures = dask.persist(*lazy_results)
-    results = dask.compute(*futures)
-    all_df = pd.concat(results, ignore_index=True)
+    # let dask collect the partitions instead of concatenating a tuple of frames
+    # the output has the input's columns and dtypes, no need to compute a partition
+    ddf = dd.from_delayed(lazy_results, meta=df.iloc[0:0], verify_meta=False)
+    all_df = ddf.compute(scheduler="threads").reset_index(drop=True)
     all_df.to_parquet(get_cleaned_dbname(singlefile))
     logger.info("Done.")
 
@@ -366,8 +497,13 @@ def create_season2_and_3_database():
     # read data for season2 and 3
     db = DBManager(args.db_fname)
     season23_image_names = db.season2and3_image_names
-    where = "image_name in {}".format(list(season23_image_names))
-    season23 = pd.read_hdf(db.dbname, "df", mode="r", where=where)
+    # A where clause with hundreds of image_names is too long for PyTables to
+    # evaluate, so pandas would read the whole table and filter a copy of it.
+    # Selecting the row coordinates from the image_name column reads only those.
+    with pd.HDFStore(str(db.dbname), mode="r") as store:
+        image_names = store.select_column("df", "image_name")
+        rows = np.flatnonzero(image_names.isin(season23_image_names).to_numpy())
+        season23 = store.select("df", where=rows)
 
     fname_base = os.path.basename(db.dbname)
     root = os.path.dirname(db.dbname)
@@ -376,39 +512,101 @@ def create_season2_and_3_database():
     newfname = "{}_seasons2and3.h5".format(rootpath)
     if os.path.exists(newfname):
         os.remove(newfname)
-    season23.to_hdf(newfname, "df", format="t", data_columns=data_columns)
+    with pd.HDFStore(newfname, mode="w") as store:
+        store.append(
+            "df",
+            season23,
+            format="table",
+            data_columns=data_columns,
+            expectedrows=len(season23),
+            index=False,
+            **HDF_KW,
+        )
+        index_image_name(store)
     logger.info("Finished. Produced %s", newfname)
 
 
-def read_csv_into_df(fname, chunks=1e6, test_n_rows=None):
-    # creating reader object with pandas interface for csv parsing
-    # doing this in chunks as its faster. Also, later will do a split
-    # into multiple processes to do this.
-    reader = pd.read_csv(
+def iter_csv_chunks(fname, chunks=1e6, test_n_rows=None):
+    """Yield the database dump `fname` as DataFrames of about `chunks` rows each.
+
+    With `chunks` set to None, the first `test_n_rows` (or all rows) are yielded
+    as one DataFrame.
+    """
+    # pyarrow parses the csv blocks on all cores, straight into typed columns
+    reader = pacsv.open_csv(
         fname,
-        chunksize=chunks,
-        na_values=["null"],
-        usecols=analysis_cols,
-        nrows=test_n_rows,
-        engine="c",
+        read_options=pacsv.ReadOptions(use_threads=True, block_size=32 << 20),
+        convert_options=pacsv.ConvertOptions(
+            include_columns=analysis_cols,
+            column_types=csv_column_types,
+            null_values=["", "null", "NaN", "nan", "NA"],
+            strings_can_be_null=True,
+        ),
     )
 
-    # if chunks were None and test_n_rows were given, then I already
-    # have the data frame:
-    if chunks is None:
-        df = reader
-    else:
-        # read in data chunk by chunk and collect into python list
-        data = [chunk for chunk in reader]
-        logger.info("Data collected into list.")
+    def to_frame(batches):
+        table = pa.Table.from_batches(batches, schema=reader.schema)
+        if chunks is None and test_n_rows is not None:
+            table = table.slice(0, test_n_rows)
+        return table.to_pandas(self_destruct=True)
+
+    max_rows = test_n_rows if chunks is None else int(chunks)
+    batches = []
+    n_rows = 0
+    for batch in reader:
+        batches.append(batch)
+        n_rows += batch.num_rows
+        if max_rows is not None and n_rows >= max_rows:
+            yield to_frame(batches)
+            if chunks is None:
+                return
+            batches = []
+            n_rows = 0
+    if batches:
+        yield to_frame(batches)
 
-        # convert list into Pandas dataframe
-        df = pd.concat(data, ignore_index=True)
+
+def read_csv_into_df(fname, chunks=1e6, test_n_rows=None):
+    df = pd.concat(iter_csv_chunks(fname, chunks, test_n_rows), ignore_index=True)
     logger.info("Conversion to dataframe complete.")
-    data = 0
     return df
 
 
+def reduce_chunk(df, rootpath, args):
+    """Run the reduction steps of `main` on one chunk `df` of the CSV dump.
+
+    The tutorials of the chunk are appended to the tutorials file, which has to be
+    removed before the first chunk.
+    """
+    # convert times to datetime object
+    if not args.raw_times:
+        convert_times(df)
+
+    # split off tutorials
+    df = splitting_tutorials(rootpath, df, append=True)
+
+    # empty lines are dropped even when keeping the dirt, they carry no data
+    # and have no tile numbers for the int16 storage type.
+    df = drop_empty_lines(df)
+    if not args.keep_dirt:
+        df = filter_data(df)
+
+    convert_ellipse_angles(df)
+    normalize_fan_angles(df)
+
+    # calculate x_angle and y_angle for clustering on angles
+    # pylint: disable=E1101
+    df = df.assign(
+        x_angle=np.cos(np.deg2rad(df["angle"])), y_angle=np.sin(np.deg2rad(df["angle"]))
+    )
+    # pylint: enable=E1101
+    dtypes = storage_dtypes
+    if args.keep_dirt:
+        # dirty rows may still lack tile numbers
+        dtypes = dict(storage_dtypes, x_tile="float32", y_tile="float32")
+    return df.astype(dtypes)
+
+
 def main():
     import imp
 
@@ -477,51 +675,42 @@ def main():
     else:
         chunks = 1e6
 
-    # first read CSV into dataframe
-    df = read_csv_into_df(fname, chunks, args.test_n_rows)
-    length = len(df)
-    logger.info("Length of first import: %i", length)
-
-    # convert times to datetime object
-    if not args.raw_times:
-        convert_times(df)
-
-    # split off tutorials
-    df = splitting_tutorials(rootpath, df)
-    logger.info("Length after splitting off tutorials: %i", df.shape[0])
-
-    logger.info("Scanning for and dropping empty lines now.")
-    df = df.dropna(how="all")
-    logger.info("Dropped empty lines.")
-    logger.info("New length: %i", df.shape[0])
-
-    if not args.keep_dirt:
-        logger.info("Now filtering for unwanted data.")
-        df = filter_data(df)
-        logger.info("Done cleaning bad data.")
-        logger.info("New length: %i", df.shape[0])
-
-    convert_ellipse_angles(df)
-    normalize_fan_angles(df)
-
-    # calculate x_angle and y_angle for clustering on angles
-    # pylint: disable=E1101
-    df = df.assign(
-        x_angle=np.cos(np.deg2rad(df["angle"])), y_angle=np.sin(np.deg2rad(df["angle"]))
-    )
-    # pylint: enable=E1101
-
-    if args.do_fastread:
-        produce_fast_read(rootpath, df)
-
-    logger.info("Now writing query-able database file.")
-    df.to_hdf(newfpath, "df", format="table", data_columns=["image_name"])
+    # stream the CSV chunk by chunk through the reduction into the database
+    # file, so that the full dump never has to be in memory at once.
+    length = 0
+    # all chunks append their tutorials. An empty table is not written at all, so
+    # a tutorials file of an earlier run has to go first.
+    tutfpath = get_tutorials_fpath(rootpath)
+    if os.path.exists(tutfpath):
+        os.remove(tutfpath)
+    with pd.HDFStore(newfpath, mode="w") as store:
+        for df in iter_csv_chunks(fname, chunks, args.test_n_rows):
+            length += len(df)
+            logger.info("Reducing rows %i to %i.", length - len(df), length)
+            df = reduce_chunk(df, rootpath, args)
+            convert_categories_to_objects(df)
+            store.append(
+                "df",
+                df,
+                format="table",
+                data_columns=["image_name"],
+                min_itemsize=dict(HDF_STRING_ITEMSIZE, image_name=32),
+                # indexed once below, not after every chunk
+                index=False,
+                **HDF_KW,
+            )
+        logger.info("Length of first import: %i", length)
+        logger.info("Length of reduced database: %i", store.get_storer("df").nrows)
+        # the chunks are appended in CSV order, so per-image_name queries rely on
+        # a completely sorted index to find their rows without a full scan.
+        logger.info("Indexing image_name.")
+        store.create_table_index("df", columns=["image_name"], optlevel=9, kind="full")
     logger.info(
         "Writing to HDF file finished. Created %s. " "Reduction complete.", newfpath
     )
 
-    # free memory
-    df = 0
+    if args.do_fastread:
+        produce_fast_read(rootpath, pd.read_hdf(newfpath, "df"))
 
     if not args.keep_dups:
         remove_duplicates_from_file(newfpath)
@@ -1,7 +1,6 @@
 from math import tau
 from pathlib import Path
 
-import dask.dataframe as dd
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
@@ -121,13 +120,17 @@ def define_season_column(df, colname="image_name"):
     colname : str
         Name of column to be used as HiRISE observation ID.
     """
-    thousands = df[colname].str[5:7].astype("int")
-    df["season"] = 0
-    df.loc[df[colname].str.startswith("PSP"), "season"] = 1
-    df.loc[(thousands > 10) & (thousands < 15), "season"] = 2
-    df.loc[(thousands > 15) & (thousands < 25), "season"] = 3
-    df.loc[(thousands > 25) & (thousands < 35), "season"] = 4
-    df.loc[(thousands > 35), "season"] = 5
+    obsids = df[colname].str
+    thousands = obsids[5:7].astype("int").values
+    # np.select takes the first match, so the highest season is checked first
+    conditions = [
+        thousands > 35,
+        (thousands > 25) & (thousands < 35),
+        (thousands > 15) & (thousands < 25),
+        (thousands > 10) & (thousands < 15),
+        obsids.startswith("PSP").values,
+    ]
+    df["season"] = np.select(conditions, [5, 4, 3, 2, 1], default=0).astype("int8")
 
 
 def define_martian_year(df, time_col_name):
@@ -138,16 +141,17 @@ def define_martian_year(df, time_col_name):
 
 
 def calculate_percent_lost(database_fname):
-    ddf = dd.read_parquet(database_fname)
-    image_names = ddf.image_name.unique().compute()
-
     keys = ["image_id", "user_name"]
     cols = ["created_at", "classification_id"]
 
+    # one read of the needed columns, partitioned in a single groupby pass,
+    # instead of a filtered scan of the database per image_name.
+    df = pd.read_parquet(database_fname, columns=["image_name"] + keys + cols)
+    grouped = df.groupby("image_name", sort=False, observed=True)
+
     times = []
     percent_lost = []
-    for image_name in tqdm(image_names):
-        example = ddf[ddf.image_name == image_name].compute()
+    for _, example in tqdm(grouped, total=grouped.ngroups):
         old = example.shape[0]
         g = example[keys + cols].groupby(keys, sort=False)
         c_ids = g[cols].min().classification_id.values
@@ -125,3 +125,19 @@ class Test_Fan:
         assert np.allclose(np.array([1.0, 0.0]), fan.v1)
 
         assert np.allclose(np.array([0.0, 1.0]), fan.v2)
+
+    def test_from_dataframe(self):
+        df = pd.DataFrame([[0, 0, 1, 0, 90],
+                           [0, 0, 2, 90, 90],
+                           [0, 0, np.sqrt(2), 45, 90]],
+                          columns=self.index)
+        fans = Fan.from_dataframe(df)
+
+        assert len(fans) == 3
+        for fan, (_, row) in zip(fans, df.iterrows()):
+            single = Fan(row)
+            assert np.allclose(single.armlength, fan.armlength)
+            assert np.allclose(single.v1, fan.v1)
+            assert np.allclose(single.v2, fan.v2)
+            assert np.allclose(single.coords, fan.coords)
+
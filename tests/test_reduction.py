@@ -0,0 +1,160 @@
+import numpy as np
+import pandas as pd
+import pkg_resources as pr
+import pytest
+
+from planet4 import markings, reduction
+
+
+@pytest.fixture(scope='module')
+def data():
+    """Read data from test database csv file. """
+    with pr.resource_stream('planet4', 'data/test_db.csv') as f:
+        df = pd.read_csv(f, parse_dates=['created_at'])
+    return df
+
+
+def groupby_remove_duplicates(data):
+    "The groupby implementation of `remove_duplicates_from_image_name_data`."
+    c_ids = []
+
+    def process_user_group(g):
+        c_ids.append(g[g.created_at == g.created_at.min()].classification_id.min())
+
+    data.groupby(['image_id', 'user_name'], sort=False).apply(process_user_group)
+    return data.set_index('classification_id').loc[list(set(c_ids))].reset_index()
+
+
+def assert_same_rows(result, expected):
+    cols = sorted(expected.columns)
+    result = result[cols].sort_values(cols).reset_index(drop=True)
+    expected = expected[cols].sort_values(cols).reset_index(drop=True)
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+
+def make_duplicates():
+    t0 = pd.Timestamp('2013-01-08 07:28:26')
+    later = t0 + pd.Timedelta(minutes=5)
+    rows = [
+        # same user saw the same tile twice, the earlier classification stays
+        ('c2', later, 'APF0000001', 'anna', 1.0),
+        ('c1', t0, 'APF0000001', 'anna', 2.0),
+        ('c1', t0, 'APF0000001', 'anna', 3.0),
+        # equal created_at, the smaller classification_id stays
+        ('c4', t0, 'APF0000002', 'anna', 4.0),
+        ('c3', t0, 'APF0000002', 'anna', 5.0),
+        ('c5', later, 'APF0000001', 'bert', 6.0),
+        # rows without user_name are not kept
+        ('c6', t0, 'APF0000001', np.nan, 7.0),
+        ('c7', later, 'APF0000002', np.nan, 8.0),
+    ]
+    return pd.DataFrame(
+        rows, columns=['classification_id', 'created_at', 'image_id', 'user_name', 'x']
+    )
+
+
+class TestRemoveDuplicates:
+    def test_synthetic(self):
+        data = make_duplicates()
+        result = reduction.remove_duplicates_from_image_name_data(data)
+
+        assert sorted(result.classification_id.unique()) == ['c1', 'c3', 'c5']
+        assert result.user_name.notna().all()
+        assert_same_rows(result, groupby_remove_duplicates(data))
+
+    def test_categoricals(self):
+        data = make_duplicates()
+        for col in ['image_id', 'user_name']:
+            data[col] = data[col].astype('category')
+        result = reduction.remove_duplicates_from_image_name_data(data)
+        assert sorted(result.classification_id.unique()) == ['c1', 'c3', 'c5']
+
+    def test_test_db(self, data):
+        for _, image_name_data in data.groupby('image_name'):
+            result = reduction.remove_duplicates_from_image_name_data(image_name_data)
+            assert_same_rows(result, groupby_remove_duplicates(image_name_data))
+
+
+def split_filter_data(df):
+    "The split-and-concat implementation of `filter_data`."
+    fans = df[df.marking == 'fan']
+    blotches = df[df.marking == 'blotch']
+    rest = df[(df.marking != 'fan') & (df.marking != 'blotch')]
+
+    fans = fans.dropna(how='any', subset=reduction.fan_data_cols)
+    blotches = blotches.dropna(how='any', subset=reduction.blotch_data_cols)
+
+    eps = 0.00001
+    bzero_filter = (blotches.x.abs() < eps) & (blotches.y.abs() < eps)
+    fzero_filter = (fans.x.abs() < eps) & (fans.y.abs() < eps)
+    rest_zero_filter = (rest.x.abs() < eps) & (rest.y.abs() < eps)
+    blotch_defaults = ((blotches.radius_1 - 10) < eps) & (
+        (blotches.radius_2 - 10).abs() < eps
+    )
+    fan_defaults = (fans.angle.abs() < eps) & ((fans.distance - 10).abs() < eps)
+    fans = fans[~(fzero_filter & fan_defaults)]
+    fan_defaults2 = (
+        ((fans.angle.abs() - 90.0) < eps)
+        & ((fans.spread - 2.017450) < eps)
+        & ((fans.distance - 10) < eps)
+    )
+    fans = fans[~fan_defaults2]
+    blotches = blotches[~(bzero_filter & blotch_defaults)]
+    rest = rest[~rest_zero_filter]
+    df = pd.concat([fans, blotches, rest], ignore_index=True)
+
+    none = df[df.marking == 'none']
+    rest = df[df.marking != 'none']
+    delta = 25
+    q = '{} < x < {} and {} < y < {}'.format(
+        -delta, markings.IMG_X_SIZE + delta, -delta, markings.IMG_Y_SIZE + delta
+    )
+    rest = rest.query(q)
+    return pd.concat([rest, none], ignore_index=True)
+
+
+def make_dirty_markings():
+    cols = 'marking x y radius_1 radius_2 distance angle spread x_tile y_tile'.split()
+    rows = [
+        ('fan', 100, 200, np.nan, np.nan, 50, 30, 20, 1, 1),
+        # incomplete fan
+        ('fan', 100, 200, np.nan, np.nan, np.nan, 30, 20, 1, 1),
+        # default fans
+        ('fan', 0, 0, np.nan, np.nan, 10, 0, 20, 1, 1),
+        ('fan', 10, 10, np.nan, np.nan, 10, 90, 2.01745, 1, 1),
+        ('blotch', 300, 400, 20, 30, np.nan, 45, np.nan, 1, 1),
+        # incomplete and default blotch
+        ('blotch', 300, 400, np.nan, 30, np.nan, 45, np.nan, 1, 1),
+        ('blotch', 0, 0, 10, 10, np.nan, 0, np.nan, 1, 1),
+        # outside the tile
+        ('blotch', -100, 400, 20, 30, np.nan, 45, np.nan, 1, 1),
+        ('fan', 100, 900, np.nan, np.nan, 50, 30, 20, 1, 1),
+        # 'none' markings are kept without coordinates, unless at zero
+        ('none', np.nan, np.nan, np.nan, np.nan, np.nan, np.nan, np.nan, 1, 1),
+        ('none', 0, 0, np.nan, np.nan, np.nan, np.nan, np.nan, 1, 1),
+        # dirty row without marking
+        (np.nan, 500, 300, np.nan, np.nan, np.nan, np.nan, np.nan, 2, 2),
+        # empty line of the dump
+        (np.nan,) * 10,
+    ]
+    return pd.DataFrame(rows, columns=cols)
+
+
+class TestFilterData:
+    def test_synthetic(self):
+        data = make_dirty_markings()
+        result = reduction.filter_data(data)
+
+        assert len(result) == 4
+        assert_same_rows(result, split_filter_data(data))
+
+    def test_test_db(self, data):
+        result = reduction.filter_data(data)
+        assert_same_rows(result, split_filter_data(data))
+
+    def test_drop_empty_lines(self):
+        data = make_dirty_markings()
+        result = reduction.drop_empty_lines(data)
+
+        assert len(result) == len(data) - 1
+        assert result.x_tile.notna().all()
@@ -0,0 +1,37 @@
+import pandas as pd
+
+from planet4 import stats
+
+
+def loop_define_season_column(df, colname='image_name'):
+    "The chained assignment implementation of `define_season_column`."
+    thousands = df[colname].str[5:7].astype('int')
+    df['season'] = 0
+    df.loc[df[colname].str.startswith('PSP'), 'season'] = 1
+    df.loc[(thousands > 10) & (thousands < 15), 'season'] = 2
+    df.loc[(thousands > 15) & (thousands < 25), 'season'] = 3
+    df.loc[(thousands > 25) & (thousands < 35), 'season'] = 4
+    df.loc[(thousands > 35), 'season'] = 5
+
+
+def test_define_season_column():
+    # including the thousands at the season borders, which get no season
+    obsids = [
+        'PSP_002622_0945', 'PSP_003092_0985', 'ESP_010500_0985', 'ESP_011296_0975',
+        'ESP_014995_0985', 'ESP_015000_0985', 'ESP_020115_0985', 'ESP_025000_0985',
+        'ESP_029763_0985', 'ESP_035000_0985', 'ESP_040000_0985',
+    ]
+    df = pd.DataFrame(dict(image_name=obsids))
+    expected = df.copy()
+    loop_define_season_column(expected)
+
+    stats.define_season_column(df)
+
+    assert df.season.tolist() == expected.season.tolist()
+    assert df.season.tolist() == [1, 1, 0, 2, 2, 0, 3, 0, 4, 0, 5]
+
+
+def test_define_season_column_other_colname():
+    df = pd.DataFrame(dict(obsid=['ESP_011296_0975', 'ESP_020115_0985']))
+    stats.define_season_column(df, colname='obsid')
+    assert df.season.tolist() == [2, 3]